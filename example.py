@@ -1,11 +1,16 @@
+import argparse
 import asyncio
+import getpass
 import hashlib
 import hmac
 import logging
+import os
+import sys
 import uuid
-from optparse import OptionParser
+from urllib.parse import urlsplit
 
 import aiohttp
+import orjson
 
 from ms.base import MSRPCChannel
 from ms.rpc import Lobby
@@ -26,18 +31,30 @@ async def main():
     """
     Login to the CN server with username and password and get latest 30 game logs.
     """
-    parser = OptionParser()
-    parser.add_option("-u", "--username", type="string", help="Your account name.")
-    parser.add_option("-p", "--password", type="string", help="Your account password.")
-    parser.add_option("-l", "--log", type="string", help="Your log UUID for load.")
-
-    opts, _ = parser.parse_args()
-    username = opts.username
-    password = opts.password
-    log_uuid = opts.log
-
-    if not username or not password:
-        parser.error("Username or password cant be empty")
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-u",
+        "--username",
+        default=os.environ.get("MS_USER"),
+        help="Your account name. Defaults to $MS_USER.",
+    )
+    parser.add_argument(
+        "-p",
+        "--password",
+        default=os.environ.get("MS_PASS"),
+        help="Your account password. Defaults to $MS_PASS, prompted if unset.",
+    )
+    parser.add_argument("-l", "--log", help="Your log UUID for load.")
+
+    args = parser.parse_args()
+    username = args.username
+    log_uuid = args.log
+
+    if not username:
+        parser.error("Username cant be empty")
+    password = args.password or getpass.getpass()
+    if not password:
+        parser.error("Password cant be empty")
 
     lobby, channel, version_to_force = await connect()
     await login(lobby, username, password, version_to_force)
@@ -59,17 +76,17 @@ async def main():
 async def connect() -> tuple[Lobby, MSRPCChannel, str]:
     async with aiohttp.ClientSession() as session:
         async with session.get("{}/1/version.json".format(MS_HOST)) as res:
-            version = await res.json()
+            version = await res.json(loads=orjson.loads)
             logging.info(f"Version: {version}")
             version = version["version"]
             version_to_force = version.replace(".w", "")
 
         async with session.get("{}/1/v{}/config.json".format(MS_HOST, version)) as res:
-            config = await res.json()
+            config = await res.json(loads=orjson.loads)
             logging.info(f"Config: {config}")
 
             server = config["ip"][0]["gateways"][1]["url"]
-            endpoint = "wss://{}/gateway".format(server.strip("https://"))
+            endpoint = "wss://{}/gateway".format(urlsplit(server).netloc)
 
     logging.info(f"Chosen endpoint: {endpoint}")
     channel = MSRPCChannel(endpoint)
@@ -85,13 +102,11 @@ async def connect() -> tuple[Lobby, MSRPCChannel, str]:
 async def login(lobby: Lobby, username: str, password: str, version_to_force: str):
     logging.info("Login with username and password")
 
-    uuid_key = str(uuid.uuid1())
-
     req = pb.ReqLogin()
     req.account = username
     req.password = hmac.new(b"lailai", password.encode(), hashlib.sha256).hexdigest()
     req.device.is_browser = True
-    req.random_key = uuid_key
+    req.random_key = uuid.uuid4().hex
     req.gen_access_token = True
     req.client_version_string = f"web-{version_to_force}"
     req.currency_platforms.append(2)
@@ -173,4 +188,9 @@ if __name__ == "__main__":
     file_handler = logging.FileHandler("app.log", encoding="utf-8")
     file_handler.setLevel(logging.INFO)
     logging.getLogger().addHandler(file_handler)
-    asyncio.run(main())
+    if sys.platform != "win32":
+        import uvloop
+
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
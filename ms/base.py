@@ -36,7 +36,10 @@ class MSRPCChannel:
         return wrapper.SerializeToString()
 
     async def connect(self, ms_host):
-        self._ws = await websockets.connect(self._endpoint, origin=ms_host)
+        # Frames are binary protobuf only: skip permessage-deflate entirely.
+        self._ws = await websockets.connect(
+            self._endpoint, origin=ms_host, compression=None
+        )
         self._msg_dispatcher = asyncio.create_task(self.dispatch_msg())
 
     async def close(self):
@@ -50,15 +53,18 @@ class MSRPCChannel:
 
     async def dispatch_msg(self):
         while True:
-            msg = await self._ws.recv()
+            msg = await self._ws.recv(decode=False)
+            # Slice through a memoryview so the payload is parsed in place
+            # instead of being copied into a new bytes object first.
+            view = memoryview(msg)
             type_byte = msg[0]
             if type_byte == 1:  # NOTIFY
-                wrapper = self.unwrap(msg[1:])
+                wrapper = self.unwrap(view[1:])
                 logging.info(f"Got Notify: {wrapper.name}")
                 for hook in self._hooks.get(wrapper.name, []):
                     asyncio.create_task(hook(wrapper.data))
             elif type_byte == 2:  # REQUEST
-                wrapper = self.unwrap(msg[3:])
+                wrapper = self.unwrap(view[3:])
                 logging.info(f"Got Request: {wrapper.name}")
                 for hook in self._hooks.get(wrapper.name, []):
                     asyncio.create_task(hook(wrapper.data))
@@ -90,7 +96,7 @@ class MSRPCChannel:
         if idx in self._req_events:
             del self._req_events[idx]
 
-        body = self.unwrap(res[3:])
+        body = self.unwrap(memoryview(res)[3:])
 
         return body.data
 
@@ -14,9 +14,11 @@ setup(
     author_email='alexey@nihisil.com',
     url='https://github.com/MahjongRepository/mahjong_soul_api',
     install_requires=[
-        'protobuf',
+        'protobuf>=4.21',
         'websockets',
-        'aiohttp',
+        'aiohttp[speedups]>=3.13.3',
+        'orjson',
+        'uvloop>=0.19; platform_system != "Windows"',
     ],
     classifiers=[
         'Development Status :: 5 - Production/Stable',
@@ -1,27 +1,65 @@
+import argparse
 import base64
 import asyncio
-import hashlib
+import getpass
 import hmac
 import logging
+import os
+import sys
 import uuid
-from optparse import OptionParser
-from typing import Awaitable
+from collections import deque
+from functools import lru_cache
+from typing import Awaitable, Callable
+from urllib.parse import urlsplit
+
+# Must be set before any generated protobuf module is imported, otherwise the
+# pure-Python backend may be picked and every FromString runs in Python.
+os.environ.setdefault("PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION", "upb")
 
 import aiohttp
+import orjson
+from google.protobuf.internal import api_implementation
 from google.protobuf.message import Message
 
 from ms.base import MSRPCChannel
 from ms.rpc import Lobby, FastTest, Route
 import ms.protocol_pb2 as pb
 
+if api_implementation.Type() not in ("upb", "cpp"):
+    raise RuntimeError(
+        f"Native protobuf backend required, got {api_implementation.Type()}"
+    )
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s %(levelname)s: %(message)s",
     datefmt="%Y-%m-%d %H:%M:%S",
 )
+logger = logging.getLogger(__name__)
 
 MS_HOST = "https://game.maj-soul.com"
 
+_ACTION_DECODERS: dict[str, Callable[[bytes], Message]] = {
+    "ActionMJStart": pb.ActionMJStart.FromString,
+    "ActionDiscardTile": pb.ActionDiscardTile.FromString,
+    "ActionDealTile": pb.ActionDealTile.FromString,
+    "ActionChiPengGang": pb.ActionChiPengGang.FromString,
+    "ActionNewRound": pb.ActionNewRound.FromString,
+}
+
+
+@lru_cache(maxsize=1024)
+def _decode_action(name: str, data: bytes) -> Message:
+    # Cached messages are shared between callers and must not be mutated.
+    return _ACTION_DECODERS[name](data)
+
+
+# Fields shared by every login request, copied into each new ReqLogin.
+_LOGIN_TEMPLATE = pb.ReqLogin()
+_LOGIN_TEMPLATE.device.is_browser = True
+_LOGIN_TEMPLATE.gen_access_token = True
+_LOGIN_TEMPLATE.currency_platforms.append(2)
+
 
 class Manager:
     lobby: Lobby
@@ -35,19 +73,57 @@ class Manager:
     account_id: int
     client_version_string: str
 
+    def __init__(self):
+        self._wake = asyncio.Event()
+        self._pending: deque[Awaitable] = deque()
+        self._action = pb.ActionPrototype()
+
+    def submit(self, coro: Awaitable):
+        """
+        Extension point for hooks: queue work to be awaited by run_pending().
+        None of the built-in hooks produce follow-up work yet.
+        """
+        self._pending.append(coro)
+        self._wake.set()
+
+    async def run_pending(self):
+        """
+        Await submitted jobs in order, idling on an event until one arrives.
+        """
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            while self._pending:
+                try:
+                    res = await self._pending.popleft()
+                except Exception:
+                    logger.exception("Pending job failed")
+                    continue
+                if __debug__:
+                    logger.info(res)
+
     async def init(self):
-        parser = OptionParser()
-        parser.add_option("-u", "--username", type="string", help="Your account name.")
-        parser.add_option(
-            "-p", "--password", type="string", help="Your account password."
+        parser = argparse.ArgumentParser()
+        parser.add_argument(
+            "-u",
+            "--username",
+            default=os.environ.get("MS_USER"),
+            help="Your account name. Defaults to $MS_USER.",
+        )
+        parser.add_argument(
+            "-p",
+            "--password",
+            default=os.environ.get("MS_PASS"),
+            help="Your account password. Defaults to $MS_PASS, prompted if unset.",
         )
 
-        opts, _ = parser.parse_args()
-        username = opts.username
-        password = opts.password
-
-        if not username or not password:
-            parser.error("Username or password cant be empty")
+        args = parser.parse_args()
+        username = args.username
+        if not username:
+            parser.error("Username cant be empty")
+        password = args.password or getpass.getpass()
+        if not password:
+            parser.error("Password cant be empty")
 
         await self.connect()
         await self.login(username, password)
@@ -57,10 +133,16 @@ class Manager:
         )
 
     async def connect(self):
-        async with aiohttp.ClientSession() as session:
+        # With aiodns installed (aiohttp[speedups]) the connector's default
+        # resolver is already the c-ares AsyncResolver, and it owns closing it.
+        connector = aiohttp.TCPConnector(ttl_dns_cache=300, limit=4)
+        timeout = aiohttp.ClientTimeout(total=10)
+        async with aiohttp.ClientSession(
+            connector=connector, timeout=timeout
+        ) as session:
             async with session.get("{}/1/version.json".format(MS_HOST)) as res:
-                version = await res.json()
-                logging.info(f"Version: {version}")
+                version = await res.json(loads=orjson.loads)
+                logger.info("Version: %s", version)
                 version = version["version"]
                 self.version_to_force = version.replace(".w", "")
                 self.client_version_string = f"web-{self.version_to_force}"
@@ -68,41 +150,35 @@ class Manager:
             async with session.get(
                 "{}/1/v{}/config.json".format(MS_HOST, version)
             ) as res:
-                config = await res.json()
-                logging.info(f"Config: {config}")
+                config = await res.json(loads=orjson.loads)
+                logger.info("Config: %s", config)
 
                 server = config["ip"][0]["gateways"][1]["url"]
-                self.endpoint_raw = server.strip("https://")
+                self.endpoint_raw = urlsplit(server).netloc
                 endpoint = f"wss://{self.endpoint_raw}/gateway"
 
-        logging.info(f"Chosen endpoint: {endpoint}")
+        logger.info("Chosen endpoint: %s", endpoint)
         self.channel = MSRPCChannel(endpoint)
 
         self.lobby = Lobby(self.channel)
         await self.channel.connect(MS_HOST)
-        logging.info("Connection was established")
+        logger.info("Connection was established")
 
     async def login(self, username: str, password: str):
-        logging.info("Login with username and password")
-
-        uuid_key = str(uuid.uuid1())
+        logger.info("Login with username and password")
 
         req = pb.ReqLogin()
+        req.CopyFrom(_LOGIN_TEMPLATE)
         req.account = username
-        req.password = hmac.new(
-            b"lailai", password.encode(), hashlib.sha256
-        ).hexdigest()
-        req.device.is_browser = True
-        req.random_key = uuid_key
-        req.gen_access_token = True
+        req.password = hmac.digest(b"lailai", password.encode("utf-8"), "sha256").hex()
+        req.random_key = uuid.uuid4().hex
         req.client_version_string = self.client_version_string
-        req.currency_platforms.append(2)
 
         res = await self.lobby.login(req)
         self.token = res.access_token
         if not self.token:
-            logging.error("Login Error:")
-            logging.error(res)
+            logger.error("Login Error:")
+            logger.error(res)
             return False
 
         self.account_id = res.account_id
@@ -110,46 +186,52 @@ class Manager:
         return True
 
     async def hook_notify_room_game_start(self, data: bytes):
-        logging.info("Room Game Start!")
+        logger.info("Room Game Start!")
         start_data = pb.NotifyRoomGameStart.FromString(data)
-        logging.info(f"Game Start Info: \n{start_data}")
+        if __debug__:
+            logger.info("Game Start Info: \n%s", start_data)
 
         new_channel = MSRPCChannel(endpoint=f"wss://{self.endpoint_raw}/game-gateway")
         self.fast_test = FastTest(channel=new_channel)
-        await new_channel.connect(MS_HOST)
         new_channel.add_hook(".lq.ActionPrototype", self.hook_action_prototype)
+        # Build the auth request while the websocket handshake is in flight;
+        # the sleep(0) lets connect() run up to its first network wait.
+        connect_task = asyncio.create_task(new_channel.connect(MS_HOST))
+        await asyncio.sleep(0)
 
-        logging.info("Authing Game...")
+        logger.info("Authing Game...")
         auth_req = pb.ReqAuthGame(
             account_id=self.account_id,
             token=start_data.connect_token,
             game_uuid=start_data.game_uuid,
         )
-        logging.info(f"Using req:\n{auth_req}")
+        if __debug__:
+            logger.info("Using req:\n%s", auth_req)
+        await connect_task
         auth_res = await self.fast_test.auth_game(auth_req)
-        logging.info(f"Auth Game Succeeded. Info: \n{auth_res}")
+        if __debug__:
+            logger.info("Auth Game Succeeded. Info: \n%s", auth_res)
 
-        logging.info("Entering Game...")
+        logger.info("Entering Game...")
         await self.fast_test.enter_game(pb.ReqCommon())
-        logging.info("Enter Game Succeeded")
+        logger.info("Enter Game Succeeded")
 
     async def hook_action_prototype(self, data: bytes):
-        action = pb.ActionPrototype.FromString(data)
-        logging.info(f"Received Action: \n{action}")
-
-        action_name_to_type: dict[str, type[Message]] = {
-            "ActionMJStart": pb.ActionMJStart,
-            "ActionDiscardTile": pb.ActionDiscardTile,
-            "ActionDealTile": pb.ActionDealTile,
-            "ActionChiPengGang": pb.ActionChiPengGang,
-            "ActionNewRound": pb.ActionNewRound,
-        }
-        if action.name not in action_name_to_type.keys():
-            logging.info(f"Action Not Available: {action.name}")
+        # ActionPrototype.data is a plain bytes field, so this parse never
+        # touches the payload; only the dispatch below decodes it. The
+        # envelope is reused across frames, which is safe as long as nothing
+        # below awaits while reading it.
+        action = self._action
+        action.Clear()
+        action.MergeFromString(data)
+        logger.info("Received Action: %s (step %d)", action.name, action.step)
+
+        if action.name not in _ACTION_DECODERS:
+            logger.info("Action Not Available: %s", action.name)
             return
-        action_data = action_name_to_type[action.name].FromString(action.data)
-        logging.info(f"Action Data:\n{action_data}")
-        logging.info(pb.GameAction.FromString(action.data))
+        action_data = _decode_action(action.name, action.data)
+        if __debug__ and logger.isEnabledFor(logging.INFO):
+            logger.info("Action Data:\n%s", action_data)
 
 
 async def main():
@@ -158,31 +240,18 @@ async def main():
     req = pb.ReqJoinRoom(room_id=40752, client_version_string=m.version_to_force)
     res = await m.lobby.join_room(req)
     room = res.room
-    logging.info(room.room_id)
-    logging.info(room.owner_id)
-    logging.info(room.mode)
-    logging.info(room.max_player_count)
-    logging.info(room.persons)
-    logging.info(room.ready_list)
-    logging.info(room.is_playing)
-    logging.info(room.public_live)
-    logging.info(room.robot_count)
-    logging.info(room.tournament_id)
-    logging.info(room.seq)
-    logging.info(room.pre_rule)
-    logging.info(room.robots)
-    logging.info(room.positions)
+    if __debug__:
+        logger.info("Joined Room:\n%s", room)
 
     req = pb.ReqRoomReady(ready=True)
     await m.lobby.ready_play(req)
-    while True:
-        coro: Awaitable | None = None
-        await asyncio.sleep(1)
-        if coro:
-            res = await coro
-            logging.info(res)
-        await asyncio.sleep(1)
+    await m.run_pending()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if sys.platform != "win32":
+        import uvloop
+
+        uvloop.run(main())
+    else:
+        asyncio.run(main())